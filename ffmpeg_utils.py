@@ -1,15 +1,31 @@
 import base64
+import functools
 import os
 import re
 import subprocess
+import sys
 from pathlib import Path
 
+import numpy as np
 from ffmpeg_progress_yield import FfmpegProgress
 from tqdm import tqdm
 
 import file_utils
 
 
+# progress bar format used while inserting or burning subtitles
+subtitle_bar_format = "{desc} [{bar}] {percentage:3.0f}% | {rate_fmt}{postfix} | ETA: {remaining} | ⏱: {elapsed}"
+
+# paths that can be given as is to ffmpeg subtitles filter. only letters, digits, space, "-", "_", "/" and "."
+ffmpeg_filter_safe_path = re.compile(r"[\w \-/.]*")
+
+# scale at minimul height of 480p. it also will make the dimensions divisible by 2
+scale_filter = "scale='ceil((max(480,ih)*iw/ih)/2)*2:ceil(max(480,ih)/2)*2'"
+
+# output options used when encoding video. also used to probe hardware encoders
+video_encode_args = ["-pix_fmt", "yuv420p", "-sws_flags", "bicubic+accurate_rnd+full_chroma_int+full_chroma_inp"]
+
+
 def insert_subtitle(input_media_path: Path, subtitles_path: [Path], burn_subtitles: bool, output_video_path: Path, codec_video: str = "h264", codec_audio: str = "aac"):
     # use only valid srt files
     subtitles_path: [Path] = file_utils.validate_files(subtitles_path)
@@ -26,9 +42,9 @@ def insert_subtitle(input_media_path: Path, subtitles_path: [Path], burn_subtitl
                                  "-ignore_unknown"])
 
     # detect if input has video channels
-    result: str = subprocess.run(["ffprobe", "-i", "file:" + input_media_path.as_posix(), "-show_streams",
-                                 "-select_streams", "V", "-loglevel", "error"], capture_output=True, text=True).stdout
-    no_video = True if result is None or "DISPOSITION:attached_pic=0" not in result else False
+    result: bytes = subprocess.run(["ffprobe", "-i", "file:" + input_media_path.as_posix(), "-show_streams",
+                                   "-select_streams", "V", "-loglevel", "error"], capture_output=True).stdout
+    no_video = True if result is None or b"DISPOSITION:attached_pic=0" not in result else False
 
     # if input has no video channels, map a 1280x720 black screen
     if no_video:
@@ -57,34 +73,42 @@ def insert_subtitle(input_media_path: Path, subtitles_path: [Path], burn_subtitl
         map_index = cmd_ffmpeg.count("-i") - 1
         cmd_ffmpeg_input_map.extend(["-map", f"{map_index}:s"])
 
-    # add comand to burn subtitles if its demanded and has at least one valid subtitle in the array. Burn the first one. Also ensure hwupload if necessary
-    vf_hwupload = True if codec_video.endswith(
-        ("_nvenc", "_amf", "_v4l2m2m", "_qsv", "_vaapi", "_videotoolbox", "_cuvid")) else False
-    hw_device = codec_video.split("_")[-1] if vf_hwupload else None
-    # set hw_device as cuda if api is nvenc or cuvid
-    if hw_device == "nvenc" or hw_device == "cuvid":
-        hw_device = "cuda"
-        vf_hwupload = False
+    # without burning, try to only remux video and audio into the mp4 container. much faster than encode them again
+    if not (burn_subtitles and len(subtitles_path) > 0) and not no_video:
+        cmd_ffmpeg_copy = cmd_ffmpeg + cmd_ffmpeg_input_map + ["-c:V", "copy", "-c:a", "copy", "-c:s", "mov_text",
+                                                               "-movflags", "+faststart", "file:" + output_video_path.as_posix()]
+        try:
+            run_ffmpeg_with_progress(cmd_ffmpeg_copy, desc="Inserting subtitles")
+            return
+        except RuntimeError:
+            # some codecs can't be stored in mp4 container. encode them as before
+            print("Could not copy streams into mp4 container. Encoding them")
+
+    # pick the first working hardware encoder if requested
+    if codec_video == "auto":
+        codec_video = detect_hw_encoder()
 
-    # set hw_device as vaapi if api is v4l2m2m or amf
-    if hw_device == "v4l2m2m" or hw_device == "amf":
-        hw_device = "vaapi"
+    # add comand to burn subtitles if its demanded and has at least one valid subtitle in the array. Burn the first one. Also ensure hwupload if necessary
+    vf_hwupload, hw_device = get_hw_device(codec_video)
 
     if burn_subtitles and len(subtitles_path) > 0:
-        # create temp file for .srt
-        srt_temp = file_utils.TempFile(
-            "", file_ext=".srt")
+        srt_burn_path: Path = subtitles_path[0]
+        # copy .srt to a temp file unless its path has only chars that can't break the subtitles filter
+        if not ffmpeg_filter_safe_path.fullmatch(str(srt_burn_path)):
+            # create temp file for .srt
+            srt_temp = file_utils.TempFile(
+                "", file_ext=".srt")
 
-        file_utils.copy_file_if_different(
-            subtitles_path[0], srt_temp.getpath(), True)
+            file_utils.copy_file_if_different(
+                subtitles_path[0], srt_temp.getpath(), True)
+            srt_burn_path = srt_temp.getpath()
 
         # align subtitles to botton center if hass video and to center center if only audio with black screen
         sub_align = 10 if no_video else 2
 
         # insert scale, subtitles filter and hwupload if required
-        # scale at minimul height of 480p. it also will make the dimensions divisible by 2
         cmd_ffmpeg.extend(
-            ["-vf", f"format=nv12, scale='ceil((max(480,ih)*iw/ih)/2)*2:ceil(max(480,ih)/2)*2', subtitles=\'{add_ffmpeg_escape_chars(srt_temp.temp_file.name)}\':force_style='Alignment={sub_align},Fontname=Jost,PrimaryColour=&H03fcff,Fontsize=18,BackColour=&H80000000,Bold=1,Spacing=0.09,Outline=1,Shadow=0,MarginL=10,MarginR=10'" + (', hwupload' if vf_hwupload else '')])
+            ["-vf", f"format=nv12, {scale_filter}, subtitles=\'{add_ffmpeg_escape_chars(str(srt_burn_path))}\':force_style='Alignment={sub_align},Fontname=Jost,PrimaryColour=&H03fcff,Fontsize=18,BackColour=&H80000000,Bold=1,Spacing=0.09,Outline=1,Shadow=0,MarginL=10,MarginR=10'" + (', hwupload' if vf_hwupload else '')])
     else:
         if vf_hwupload:
             cmd_ffmpeg.extend(["-vf", f"format=nv12, hwupload"])
@@ -97,35 +121,90 @@ def insert_subtitle(input_media_path: Path, subtitles_path: [Path], burn_subtitl
         cmd_ffmpeg.extend(["-init_hw_device", hw_device])
 
     # add the remaining parameters and output path
-    cmd_ffmpeg.extend(["-c:V", codec_video, "-c:a", codec_audio, "-c:s", "mov_text",
-                        "-pix_fmt", "yuv420p", "-movflags", "+faststart",
-                       "-sws_flags", "bicubic+accurate_rnd+full_chroma_int+full_chroma_inp",
-                       "file:" + output_video_path.as_posix()])
+    cmd_ffmpeg.extend(["-c:V", codec_video, "-c:a", codec_audio, "-c:s", "mov_text", "-movflags", "+faststart"]
+                      + video_encode_args + ["file:" + output_video_path.as_posix()])
 
     # run FFmpeg command with a fancy progress bar
-    ff = FfmpegProgress(cmd_ffmpeg)
-    with tqdm(total=100, position=0, ascii="░▒█", desc="Inserting subtitles" if not burn_subtitles else "Burning subtitles", unit="%", unit_scale=True, leave=True, bar_format="{desc} [{bar}] {percentage:3.0f}% | {rate_fmt}{postfix} | ETA: {remaining} | ⏱: {elapsed}") as pbar:
-        for progress in ff.run_command_with_progress():
-            pbar.update(progress - pbar.n)
+    run_ffmpeg_with_progress(cmd_ffmpeg, desc="Inserting subtitles" if not burn_subtitles else "Burning subtitles")
 
     # destroy unecessary file
     if 'srt_temp' in locals():
         srt_temp.destroy()
 
 
-def extract_audio_wav(input_media_path: Path, output_path: Path):
-    # set the FFMpeg command
-    cmd_ffmpeg = ["ffmpeg", "-y", "-i", "file:" + input_media_path.as_posix(),
-                  "-vn", "-c:a", "pcm_s16le", "-ac", "1", "-ar", "16000", "file:" + output_path.as_posix()]
-
-    # run FFmpeg command with a fancy progress bar
+def run_ffmpeg_with_progress(cmd_ffmpeg: list, desc: str):
     ff = FfmpegProgress(cmd_ffmpeg)
-    with tqdm(total=100, position=0, ascii="░▒█", desc="Extracting audio", unit="%", unit_scale=True, leave=True, bar_format="{desc} {percentage:3.0f}% | ETA: {remaining} | ⏱: {elapsed}") as pbar:
+    # redraw at most twice per second. unicode blocks only on terminals
+    with tqdm(total=100, position=0, ascii="░▒█" if sys.stderr.isatty() else True, desc=desc, unit="%", unit_scale=True, leave=True, mininterval=0.5, bar_format=subtitle_bar_format) as pbar:
         for progress in ff.run_command_with_progress():
-            pbar.update(progress - pbar.n)
+            # ffmpeg reports progress many times per percent. skip updates smaller than 1%
+            if progress - pbar.n >= 1 or progress >= 100:
+                pbar.update(progress - pbar.n)
 
 
-def extract_short_wav(input_media_path: Path, output_path: Path):
+def get_hw_device(codec_video: str):
+    # return if frames must be uploaded with hwupload and the hw_device to init for the codec api
+    vf_hwupload = True if codec_video.endswith(
+        ("_nvenc", "_amf", "_v4l2m2m", "_qsv", "_vaapi", "_videotoolbox", "_cuvid")) else False
+    hw_device = codec_video.split("_")[-1] if vf_hwupload else None
+    # set hw_device as cuda if api is nvenc or cuvid
+    if hw_device == "nvenc" or hw_device == "cuvid":
+        hw_device = "cuda"
+        vf_hwupload = False
+
+    # set hw_device as vaapi if api is v4l2m2m or amf
+    if hw_device == "v4l2m2m" or hw_device == "amf":
+        hw_device = "vaapi"
+
+    return vf_hwupload, hw_device
+
+
+@functools.lru_cache(maxsize=1)
+def detect_hw_encoder(fallback: str = "h264"):
+    # list the encoders built in ffmpeg. done only once per run
+    encoders: bytes = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True).stdout
+
+    for codec in ("h264_nvenc", "h264_qsv", "h264_vaapi", "h264_videotoolbox"):
+        if codec.encode() not in encoders:
+            continue
+
+        # built in ffmpeg doesn't mean the hardware is present. encode a single black frame with the same filters and output options used to burn subtitles
+        vf_hwupload, hw_device = get_hw_device(codec)
+        cmd_ffmpeg = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", "color=black:s=256x256",
+                      "-frames:v", "1", "-vf", f"format=nv12, {scale_filter}" + (", hwupload" if vf_hwupload else "")]
+        if hw_device is not None:
+            cmd_ffmpeg.extend(["-init_hw_device", hw_device])
+        cmd_ffmpeg.extend(["-c:V", codec] + video_encode_args + ["-f", "null", "-"])
+
+        if subprocess.run(cmd_ffmpeg, capture_output=True).returncode == 0:
+            return codec
+
+    return fallback
+
+
+def load_audio(input_media_path: Path, sample_rate: int = 16000, start_sec: int = None, duration_sec: int = None, audio_filter: str = None):
+    # decode audio as mono 16 bit pcm straight from ffmpeg stdout to memory. no intermediate wav file on disk
+    # local files doesn't need the default 5s of stream analysis before start decoding
+    cmd_ffmpeg = ["ffmpeg", "-nostdin", "-threads", "0"]
+    if start_sec is not None:
+        cmd_ffmpeg += ["-ss", str(start_sec)]
+    if duration_sec is not None:
+        cmd_ffmpeg += ["-t", str(duration_sec)]
+    cmd_ffmpeg += ["-analyzeduration", "1M", "-probesize", "1M", "-i", "file:" + input_media_path.as_posix(), "-vn"]
+    if audio_filter is not None:
+        cmd_ffmpeg += ["-af", audio_filter]
+    cmd_ffmpeg += ["-f", "s16le", "-c:a", "pcm_s16le", "-ac", "1", "-ar", str(sample_rate), "-loglevel", "error", "-"]
+
+    with subprocess.Popen(cmd_ffmpeg, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+        pcm, error = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"Failed to load audio: {error.decode(errors='replace')}")
+
+    # convert to float32 in range [-1, 1] as expected by whisper
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+
+def load_short_audio(input_media_path: Path, sample_rate: int = 16000):
     # get input media duration
     duration_sec = subprocess.run(["ffprobe", "-i", "file:" + input_media_path.as_posix(), "-show_entries", "format=duration", "-v", "quiet", "-of", "csv=p=0"],
                                   capture_output=True, text=True).stdout.split("\n")[0].replace("\n", "").replace(" ", "").replace("   ", "").replace("00:", "").replace(":", "").split(".")[0]
@@ -143,22 +222,15 @@ def extract_short_wav(input_media_path: Path, output_path: Path):
         start_sec = 0
         end_sec = int(duration_sec)
 
-    # set the FFMpeg command
-    cmd_ffmpeg = ["ffmpeg", "-y", "-ss", f"{start_sec}", "-t", f"{end_sec}",  "-i", "file:" + input_media_path.as_posix(),
-                  "-vn", "-c:a", "pcm_s16le", "-af", "loudnorm", "-ac", "1", "-ar", "16000", "file:" + output_path.as_posix()]
+    # decode the short normalized window used for language detection to memory
+    return load_audio(input_media_path, sample_rate=sample_rate, start_sec=start_sec, duration_sec=end_sec, audio_filter="loudnorm")
 
-    # run FFmpeg command with a fancy progress bar
-    ff = FfmpegProgress(cmd_ffmpeg)
-    with tqdm(total=100, position=0, ascii="░▒█", desc="Extracting audio", unit="%", unit_scale=True, leave=False, bar_format="{desc} {percentage:3.0f}% | ETA: {remaining} | ⏱: {elapsed}") as pbar:
-        for progress in ff.run_command_with_progress():
-            pbar.update(progress - pbar.n)
+
+# escape ":" and "\" as required by ffmpeg filters for windows paths
+ffmpeg_escape_table = str.maketrans({":": "\x5c:", "\x5c": "\x5c\x5c"}) if os.name == 'nt' else None
 
 
 def add_ffmpeg_escape_chars(string):
-    new_string = ""
-    for char in string:
-        if os.name == 'nt':
-            if char == ":" or char == "\x5c":
-                new_string += "\x5c"
-        new_string += char
-    return new_string
+    if ffmpeg_escape_table is None:
+        return string
+    return string.translate(ffmpeg_escape_table)
@@ -1,8 +1,10 @@
+import atexit
+import errno
 import filecmp
 import os
 import shutil
+import stat
 import tempfile
-from inspect import currentframe, getframeinfo
 from pathlib import Path
 
 # return the itens in array that is not inexisting or empty
@@ -12,11 +14,14 @@ def validate_files(paths):
 
 # check if a file is existing and not empty
 def file_is_valid(path):
-    if path is not None and path.is_file():
-        size = path.stat().st_size
-        if size > 0:
-            return True
-    return False
+    if path is None:
+        return False
+    # a single stat gives both the file type and size
+    try:
+        path_stat = os.stat(path)
+    except (OSError, ValueError):
+        return False
+    return stat.S_ISREG(path_stat.st_mode) and path_stat.st_size > 0
 
 # validate if an string is a valid dir or path with valid content
 def check_valid_path(path_str):
@@ -29,9 +34,10 @@ def check_valid_path(path_str):
 
     # check if it's a directory with at least one file or a valid file with content
     if path.is_dir():
-        # check if the directory has at least one file with content
-        files_with_content = [file for file in path.iterdir() if file.is_file() and file.stat().st_size > 0]
-        if not files_with_content:
+        # check if the directory has at least one file with content. stops at the first one found
+        with os.scandir(path) as entries:
+            has_file_with_content = any(entry.is_file() and entry.stat().st_size > 0 for entry in entries)
+        if not has_file_with_content:
             raise ValueError(f"The directory '{path_str}' does not contain any files with content.")
     elif path.is_file():
         # check if the file has content
@@ -57,6 +63,12 @@ def check_existing_path(path_str):
 
     return path_str
 
+# folder where temporary files are created. resolved once instead of on every TempFile
+temp_dir = Path(Path(__file__).resolve().parent, "temp")
+# small temporary files (subtitles) are created in RAM backed /dev/shm when available. one folder per process
+shm_temp_dir = Path("/dev/shm", f"legen_temp_{os.getpid()}") if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+shm_temp_extensions = {".srt"}
+
 # create a tempfile class to use as object
 class TempFile:
 
@@ -64,10 +76,9 @@ class TempFile:
         self.final_path: Path = None if final_path is None else Path(
             final_path)
         self.file_ext = file_ext
-        os.makedirs(Path(Path(getframeinfo(
-            currentframe()).filename).resolve().parent, "temp"), exist_ok=True)
-        self.temp_file: tempfile.NamedTemporaryFile = tempfile.NamedTemporaryFile(dir=Path(Path(getframeinfo(currentframe()).filename).resolve().parent, "temp"),
-                                                                                  delete=False, suffix=file_ext)
+        file_temp_dir = shm_temp_dir if shm_temp_dir is not None and file_ext in shm_temp_extensions else temp_dir
+        os.makedirs(file_temp_dir, exist_ok=True)
+        self.temp_file: tempfile.NamedTemporaryFile = tempfile.NamedTemporaryFile(dir=file_temp_dir, delete=False, suffix=file_ext)
 
         self.temp_file_name = self.temp_file.name
         self.temp_file_path: Path = Path(self.temp_file.name)
@@ -104,7 +115,13 @@ class TempFile:
             # if file not valid ou overwrite is enabled, move overwiting existing file
             if not file_is_valid(self.final_path) or overwrite_if_valid:
                 os.makedirs(path.parent, exist_ok=True)
-                shutil.move(self.temp_file_path, path)
+                try:
+                    # atomic rename when temp and final path are in same filesystem
+                    os.replace(self.temp_file_path, path)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    shutil.move(self.temp_file_path, path)
                 self.final_path = path
         except Exception as e:
             print(f"Error saving file: {e}")
@@ -122,9 +139,10 @@ class TempFile:
 # copy an source file to destination if destination file is not equals to source
 def copy_file_if_different(src_file: Path, dst_file: Path, silent: bool = False):
     if file_is_valid(dst_file):
-        # Check if destination file exists and is different from source file
-        if filecmp.cmp(src_file, dst_file) and not silent:
-            print(f"{dst_file} already exists and is the same. No need to copy.")
+        # Check if destination file exists and is different from source file. filecmp returns early if sizes differ
+        if filecmp.cmp(src_file, dst_file):
+            if not silent:
+                print(f"{dst_file} already exists and is the same. No need to copy.")
             return
 
     os.makedirs(dst_file.parent, exist_ok=True)
@@ -138,28 +156,35 @@ def delete_folder(path: Path):
         shutil.rmtree(path)
 
 
+# the RAM backed folder is named by process, so no later run would clean it. delete it on any exit, including Ctrl-C and errors
+if shm_temp_dir is not None:
+    atexit.register(delete_folder, shm_temp_dir)
+
+
 def update_folder_times(folder_path):
     folder_path = Path(folder_path)
 
     # Keep track of the newest file's modification time for this folder
     newest_file_time = None
 
-    for item in folder_path.iterdir():
-        # Check if the item is a file
-        if item.is_file():
-            file_time = item.stat().st_mtime  # Get modification time of the file
+    # scandir entries carry the file type from the directory listing, avoiding a stat per item
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            # Check if the item is a file
+            if entry.is_file():
+                file_time = entry.stat().st_mtime  # Get modification time of the file
 
-            # Update the newest_file_time if it's the first file or if the current file is newer
-            if newest_file_time is None or file_time > newest_file_time:
-                newest_file_time = file_time
+                # Update the newest_file_time if it's the first file or if the current file is newer
+                if newest_file_time is None or file_time > newest_file_time:
+                    newest_file_time = file_time
 
-        # If the item is a subfolder, recursively update its times and find its newest file time
-        elif item.is_dir():
-            subfolder_newest_time = update_folder_times(item)
+            # If the item is a subfolder, recursively update its times and find its newest file time
+            elif entry.is_dir():
+                subfolder_newest_time = update_folder_times(entry.path)
 
-            # Update the newest_file_time if a subfolder's newest file is newer
-            if newest_file_time is None or (subfolder_newest_time is not None and subfolder_newest_time > newest_file_time):
-                newest_file_time = subfolder_newest_time
+                # Update the newest_file_time if a subfolder's newest file is newer
+                if newest_file_time is None or (subfolder_newest_time is not None and subfolder_newest_time > newest_file_time):
+                    newest_file_time = subfolder_newest_time
 
     # Update the folder's modification and creation times with the newest_file_time
     if newest_file_time is not None:
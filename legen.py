@@ -1,6 +1,9 @@
 import argparse
+import importlib
 import os
 import subprocess
+import tempfile
+import threading
 import time
 from inspect import currentframe, getframeinfo
 from pathlib import Path
@@ -8,7 +11,7 @@ from pathlib import Path
 import ffmpeg_utils
 import file_utils
 import translate_utils
-from utils import time_task, audio_extensions, video_extensions, check_other_extensions
+from utils import time_task, audio_extensions, video_extensions, media_extensions, check_other_extensions
 
 version = "v0.16"
 
@@ -34,7 +37,6 @@ print(f"""
 legen {version} - github.com/matheusbach/legen{default}
 python {__import__('sys').version}
 """)
-time.sleep(1.5)
 
 # Define parameters and configurations
 parser = argparse.ArgumentParser(prog="LeGen", description="Uses AI to locally transcribes speech from media files, generating subtitle files, translates the generated subtitles, inserts them into the mp4 container, and burns them directly into video",
@@ -57,10 +59,12 @@ parser.add_argument("--translate", type=str, default="none",
                     help="Translate subtitles to language code if not the same as origin. (default: don't translate)")
 parser.add_argument("--input_lang", type=str, default="auto",
                     help="Indicates (forces) the language of the voice in the input media (default: auto)")
+parser.add_argument("--lang_detect_scope", type=str, default="file", choices=["file", "folder", "tree"],
+                    help="When input_lang is auto, scope where a detected language is reused. file (default) detects the language of every file. folder or tree stop detecting after 3 files in a row of the same folder or of the whole input have the same language, and assume it for the remaining files")
 parser.add_argument("-c:v", "--codec_video", type=str, default="h264", metavar="VIDEO_CODEC",
-                    help="Target video codec. Can be used to set acceleration via GPU or another video API [codec_api], if supported (ffmpeg -encoders). Ex: h264, libx264, h264_vaapi, h264_nvenc, hevc, libx265 hevc_vaapi, hevc_nvenc, hevc_cuvid, hevc_qsv, hevc_amf (default: h264)")
+                    help="Target video codec used when burning subtitles, or when the input streams can't be copied into the mp4 container of output_softsubs. Can be used to set acceleration via GPU or another video API [codec_api], if supported (ffmpeg -encoders). Use auto to pick the first working hardware h264 encoder (nvenc, qsv, vaapi, videotoolbox), falling back to h264. Ex: auto, h264, libx264, h264_vaapi, h264_nvenc, hevc, libx265 hevc_vaapi, hevc_nvenc, hevc_cuvid, hevc_qsv, hevc_amf (default: h264)")
 parser.add_argument("-c:a", "--codec_audio", type=str, default="aac", metavar="AUDIO_CODEC",
-                    help="Target audio codec. (default: aac). Ex: aac, libopus, mp3, vorbis")
+                    help="Target audio codec used when burning subtitles, or when the input streams can't be copied into the mp4 container of output_softsubs. (default: aac). Ex: aac, libopus, mp3, vorbis")
 parser.add_argument("-o:s", "--output_softsubs", default=None, type=Path,
                     help="Path to the folder or output file for the video files with embedded softsub (embedded in the mp4 container and .srt files). (default: softsubs_ + input_path)")
 parser.add_argument("-o:h", "--output_hardsubs", default=None, type=Path,
@@ -77,6 +81,14 @@ parser.add_argument("--copy_files", default=False, action="store_true",
                     help="Copy other (non-video) files present in input directory to output directories. Only generate the subtitles and videos")
 args = parser.parse_args()
 
+# check translation language before loading the model and transcribing every file
+if args.translate != "none" and not translate_utils.is_language_supported(args.translate):
+    parser.error(f"Unsupported translate language code: {args.translate}")
+
+# start importing torch in background only after args are valid, so no early exit happens in the middle of the import. it takes some seconds and runs during the banner pause
+threading.Thread(target=importlib.import_module, args=("torch",)).start()
+time.sleep(1.5)
+
 if not args.output_softsubs and not args.input_path.is_file():
     args.output_softsubs = compatibility_path if (compatibility_path := Path(args.input_path.parent, "legen_srt_" + args.input_path.name)).exists() else Path(args.input_path.parent, "softsubs_" + args.input_path.name)
 if not args.output_hardsubs and not args.input_path.is_file():
@@ -89,18 +101,21 @@ else:
     torch_device = str.lower(args.transcription_device)
 
 transcription_compute_type = args.transcription_compute_type if args.transcription_compute_type != "default" else "float16" if not torch_device == "cpu" else "float32"
+# whisper engine has no auto compute type. use fp16 when running on GPU
+whisper_fp16 = transcription_compute_type in ("float16", "fp16") or (transcription_compute_type == "auto" and not torch_device == "cpu")
 
 args.transcription_model = "large-v3" if args.transcription_model == "large" else args.transcription_model
 
 # ----------------------------------------------------------------------------
 
 if args.norm:
-    # normalize video using vidqa
-    with time_task(message_start=f"Running {wblue}vidqa{default} and updating folder modifiation times in {gray}{args.input_path}{default}", end="\n"):
-        subprocess.run(["vidqa", "-i", args.input_path, "-m", "unique", "-fd",
-                        Path(Path(getframeinfo(currentframe()).filename).resolve().parent, "vidqa_data")])
-        # update folder time structure
-        file_utils.update_folder_times(args.input_path)
+    # normalize video using vidqa in background while the whisper model is loaded
+    print(f"Running {wblue}vidqa{default} in background on {gray}{args.input_path}{default}")
+    # its errors are kept in a file to not mix with model loading output nor block vidqa on a full pipe
+    vidqa_errors = tempfile.TemporaryFile()
+    vidqa_process = subprocess.Popen(["vidqa", "-i", args.input_path, "-m", "unique", "-fd",
+                                      Path(Path(getframeinfo(currentframe()).filename).resolve().parent, "vidqa_data")],
+                                     stdout=subprocess.DEVNULL, stderr=vidqa_errors)
 
 # load whisper model
 with time_task(message_start=f"\nLoading {args.transcription_engine} model: {wblue}{args.transcription_model}{default} ({transcription_compute_type}) on {wblue}{torch_device}{default}", end="\n"):
@@ -119,16 +134,41 @@ with time_task(message_start=f"\nLoading {args.transcription_engine} model: {wbl
     else:
         raise ValueError(f'Unsupported transcription engine {args.transcription_engine}. Supported values: whisperx, whisper')
 
+if args.norm:
+    # input files can only be listed after vidqa has finished
+    with time_task(message_start=f"Waiting {wblue}vidqa{default} and updating folder modifiation times in {gray}{args.input_path}{default}", end="\n"):
+        if vidqa_process.wait() != 0:
+            vidqa_errors.seek(0)
+            print(f"{red}vidqa failed with exit code {vidqa_process.returncode}{default}\n{vidqa_errors.read().decode(errors='replace')}")
+        vidqa_errors.close()
+        # update folder time structure
+        file_utils.update_folder_times(args.input_path)
+
 with time_task(message="⌛ Processing files for"):
+    # list input files sorted by folder depth and then by modification time. os.walk separates files from folders, so each file is stat'ed only once
+    input_files = []
+    for root, _, files in os.walk(args.input_path):
+        for name in files:
+            file_path = Path(root, name)
+            try:
+                input_files.append((len(file_path.parts), file_path.stat().st_mtime, file_path))
+            except OSError:
+                continue  # broken link or file removed while listing
+    input_files.sort(key=lambda item: item[:2])
+
+    # detected language and how many times in a row it was detected, by folder or input tree. see --lang_detect_scope
+    lang_detections = {}
+
     path: Path
-    for path in (item for item in sorted(sorted(Path(args.input_path).rglob('*'), key=lambda x: x.stat().st_mtime), key=lambda x: len(x.parts)) if item.is_file()):
+    for _, _, path in input_files:
         rel_path = path.relative_to(args.input_path)
         with time_task(message_start=f"\nProcessing {yellow}{rel_path.as_posix()}{default}", end="\n", message="⌚ Done in"):
             try:
                 # define file type by extensions
-                if path.suffix.lower() in video_extensions:
+                suffix = path.suffix.lower()
+                if suffix in video_extensions:
                     file_type = "video"
-                elif path.suffix.lower() in audio_extensions:
+                elif suffix in audio_extensions:
                     file_type = "audio"
                 else:
                     file_type = "other"
@@ -136,77 +176,86 @@ with time_task(message="⌛ Processing files for"):
                 if file_type == "video" or file_type == "audio":
                     # define paths
                     origin_media_path = path
-                    dupe_filename = len(check_other_extensions(path, list(video_extensions | audio_extensions))) > 1
-                    posfix_extension = path.suffix.lower().replace('.', '_') if dupe_filename else ''
+                    dupe_filename = len(check_other_extensions(path, media_extensions)) > 1
+                    posfix_extension = suffix.replace('.', '_') if dupe_filename else ''
 
-                    softsub_video_dir = Path(args.output_softsubs, rel_path.parent)
-                    burned_video_dir = Path(args.output_hardsubs, rel_path.parent)
+                    base_name = rel_path.stem + posfix_extension
+                    softsub_video_dir = args.output_softsubs / rel_path.parent
+                    burned_video_dir = args.output_hardsubs / rel_path.parent
                     # output video extension will be changed to .mp4
-                    softsub_video_path = Path(args.output_softsubs, rel_path.stem + posfix_extension + ".mp4")
-                    hardsub_video_path = Path(burned_video_dir, rel_path.stem + posfix_extension + ".mp4")
-                    subtitle_translated_path = Path(
-                        softsub_video_dir, rel_path.stem + posfix_extension + f"_{args.translate}.srt")
+                    softsub_video_path = args.output_softsubs / (base_name + ".mp4")
+                    hardsub_video_path = burned_video_dir / (base_name + ".mp4")
+                    subtitle_translated_path = softsub_video_dir / f"{base_name}_{args.translate}.srt"
                     subtitles_path = []
 
-                    if args.input_lang == "auto":
-                        # extract audio
-                        audio_short_extracted = file_utils.TempFile(
-                            None, file_ext=".wav")
-                        ffmpeg_utils.extract_short_wav(
-                            origin_media_path, audio_short_extracted.getpath())
+                    # files of same folder or input tree that share a language detected 3 times in a row reuse it
+                    lang_scope = None if args.lang_detect_scope == "file" else rel_path.parent if args.lang_detect_scope == "folder" else args.input_path
+                    scope_lang, scope_lang_count = lang_detections.get(lang_scope, (None, 0))
+
+                    if args.input_lang == "auto" and lang_scope is not None and scope_lang_count >= 3:
+                        audio_language = scope_lang
+                        print(f"Assuming audio language of {args.lang_detect_scope}: {gray}{audio_language}{default}")
+                    elif args.input_lang == "auto":
+                        # decode short audio window to memory
+                        audio_short = ffmpeg_utils.load_short_audio(origin_media_path)
                         # detect language
                         print("Detecting audio language: ", end='', flush=True)
                         if args.transcription_engine == 'whisperx':
                             audio_language = whisperx_utils.detect_language(
-                                whisper_model, audio_short_extracted.getpath())
+                                whisper_model, audio_short)
                         if args.transcription_engine == 'whisper':
                             audio_language = whisper_utils.detect_language(
-                                whisper_model, audio_short_extracted.getpath())
+                                whisper_model, audio_short)
                         print(f"{gray}{audio_language}{default}")
 
-                        audio_short_extracted.destroy()
+                        del audio_short
+
+                        if lang_scope is not None:
+                            lang_detections[lang_scope] = (audio_language, scope_lang_count + 1 if audio_language == scope_lang else 1)
                     else:
                         audio_language = args.input_lang
                         print(f"Forced input audio language: {gray}{audio_language}{default}")
                     # set path after get transcribed language
-                    subtitle_transcribed_path = Path(
-                        softsub_video_dir, rel_path.stem + posfix_extension + f"_{audio_language}.srt")
+                    subtitle_transcribed_path = softsub_video_dir / f"{base_name}_{audio_language}.srt"
                     # create temp file for .srt
                     transcribed_srt_temp = file_utils.TempFile(
                         subtitle_transcribed_path, file_ext=".srt")
+                    # check existing outputs only once. hardsub video is written only at the end of this file processing
+                    hardsub_video_valid = file_utils.file_is_valid(hardsub_video_path)
+                    transcribed_srt_valid = file_utils.file_is_valid(subtitle_transcribed_path)
                     # skip transcription if transcribed srt for this language is existing (without overwrite neabled) or will not be used in LeGen process
-                    if (file_utils.file_is_valid(subtitle_transcribed_path)) or ((args.disable_hardsubs or file_utils.file_is_valid(hardsub_video_path)) and (args.disable_srt or file_utils.file_is_valid(subtitle_transcribed_path))) and not args.overwrite:
+                    if (transcribed_srt_valid) or ((args.disable_hardsubs or hardsub_video_valid) and (args.disable_srt or transcribed_srt_valid)) and not args.overwrite:
                         print("Transcription is unnecessary. Skipping.")
                     else:
-                        # extract audio
-                        audio_extracted = file_utils.TempFile(None, file_ext=".wav")
-                        ffmpeg_utils.extract_audio_wav(
-                            origin_media_path, audio_extracted.getpath())
+                        # decode audio to memory
+                        with time_task(message_start="Decoding audio..."):
+                            audio = ffmpeg_utils.load_audio(origin_media_path)
                         # transcribe saving subtitles to temp .srt file
                         if args.transcription_engine == 'whisperx':
                             print(f"{wblue}Transcribing{default} with {gray}WhisperX{default}")
                             whisperx_utils.transcribe_audio(
-                                whisper_model, audio_extracted.getpath(), transcribed_srt_temp.getpath(), audio_language, device=torch_device, batch_size=args.transcription_batch)
+                                whisper_model, audio, transcribed_srt_temp.getpath(), audio_language, device=torch_device, batch_size=args.transcription_batch)
                         if args.transcription_engine == 'whisper':
                             print(f"{wblue}Transcribing{default} with {gray}Whisper{default}")
                             whisper_utils.transcribe_audio(
-                                model=whisper_model, audio_path=audio_extracted.getpath(), srt_path=transcribed_srt_temp.getpath(), lang=audio_language, disable_fp16=False if transcription_compute_type == "float16" or transcription_compute_type == "fp16" else True)
+                                model=whisper_model, audio=audio, srt_path=transcribed_srt_temp.getpath(), lang=audio_language, disable_fp16=not whisper_fp16)
 
-                        audio_extracted.destroy()
+                        del audio
                         # if save .srt is enabled, save it to destination dir, also update path with language code
                         if not args.disable_srt:
                             transcribed_srt_temp.save()
                     subtitles_path.append(transcribed_srt_temp.getvalidpath())
                     # translate transcribed subtitle using Google Translate if transcribed language is not equals to target
                     # skip translation if translation has not requested, has equal source and output language, if file is existing (without overwrite neabled) or will not be used in LeGen process
+                    translated_srt_valid = args.translate != "none" and file_utils.file_is_valid(subtitle_translated_path)
                     if args.translate == "none":
                         pass # translation not requested
                     elif args.translate == audio_language:
                         print("Translation is unnecessary because input and output language are the same. Skipping.")
-                    elif (args.disable_hardsubs or file_utils.file_is_valid(hardsub_video_path)) and (args.disable_srt or (file_utils.file_is_valid(subtitle_translated_path) and file_utils.file_is_valid(subtitle_transcribed_path) and file_utils.file_is_valid(subtitle_translated_path))) and not args.overwrite:
+                    elif (args.disable_hardsubs or hardsub_video_valid) and (args.disable_srt or (translated_srt_valid and file_utils.file_is_valid(subtitle_transcribed_path))) and not args.overwrite:
                         print("Translation is unnecessary. Skipping.")
                         subtitles_path.insert(0, subtitle_translated_path)
-                    elif file_utils.file_is_valid(subtitle_translated_path):
+                    elif translated_srt_valid:
                         print("Translated file found. Skipping translation.")
                         subtitles_path.insert(0, subtitle_translated_path)
                     elif transcribed_srt_temp.getvalidpath():
@@ -237,7 +286,7 @@ with time_task(message="⌛ Processing files for"):
                                                         codec_video=args.codec_video, codec_audio=args.codec_audio)
                             video_softsubs_temp.save()
                     if not args.disable_hardsubs:
-                        if file_utils.file_is_valid(hardsub_video_path) and not args.overwrite:
+                        if hardsub_video_valid and not args.overwrite:
                             print(f"Existing video file {gray}{hardsub_video_path}{default}. Skipping subtitle burn")
                         else:
                             # create the temp .mp4 with srt in video container
@@ -254,12 +303,10 @@ with time_task(message="⌛ Processing files for"):
                     if args.copy_files:
                         if not args.disable_srt:
                             # copia o arquivo extra para pasta que contém também os arquivos srt
-                            file_utils.copy_file_if_different(path, Path(
-                                args.output_softsubs, rel_path))
+                            file_utils.copy_file_if_different(path, args.output_softsubs / rel_path)
                         if not args.disable_hardsubs:
                             # copia o arquivo extra para pasta que contém os videos queimados
-                            file_utils.copy_file_if_different(path, Path(
-                                args.output_hardsubs, rel_path))
+                            file_utils.copy_file_if_different(path, args.output_hardsubs / rel_path)
             except Exception as e:
                 file = path.as_posix()
                 print(f"{red}ERROR !!!{default} {file}")
@@ -274,7 +321,6 @@ with time_task(message="⌛ Processing files for"):
                     f.close()
 
     print("Deleting temp folder")
-    file_utils.delete_folder(
-        Path(Path(getframeinfo(currentframe()).filename).resolve().parent, "temp"))
+    file_utils.delete_folder(file_utils.temp_dir)
 
     print(f"{green}Tasks done!{default}")
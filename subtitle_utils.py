@@ -166,6 +166,6 @@ def format_segments(segments: list, max_line_width_px: int = 380, max_lines_per_
 
     segments = adjust_times(segments)
     
-    print('\r                      ', end='\r', flush=True)
+    print('\r\x1b[2K', end='', flush=True)
 
     return segments
@@ -1,5 +1,6 @@
 import asyncio
 import os
+import threading
 from pathlib import Path
 
 import deep_translator
@@ -16,6 +17,17 @@ sentence_endings = ['.', '!', '?', ')', 'よ', 'ね',
 separator = " ◌ "
 separator_unjoin = separator.replace(' ', '')
 chunk_max_chars = 4999
+# GoogleTranslator instances of each executor thread, by target language
+translators = threading.local()
+
+
+def is_language_supported(lang):
+    # GoogleTranslator validates the target language on creation. chunk tasks would retry an unsupported one forever
+    try:
+        deep_translator.google.GoogleTranslator(source='auto', target=lang)
+        return True
+    except deep_translator.exceptions.LanguageNotSupportedException:
+        return False
 
 
 def translate_srt_file(srt_file_path: Path, translated_subtitle_path: Path, target_lang):
@@ -25,6 +37,12 @@ def translate_srt_file(srt_file_path: Path, translated_subtitle_path: Path, targ
     # Extract the subtitle content and store it in a list. Also rejoin all lines splited
     sub_content = [' '.join(sub.text.strip().splitlines()) for sub in subs]
 
+    # Nothing to translate. Save the subtitle as is without requesting Google Translate
+    if not any(sub_content):
+        os.makedirs(translated_subtitle_path.parent, exist_ok=True)
+        subs.save(translated_subtitle_path, encoding='utf-8')
+        return subs
+
     # Make chunks of at maximum $chunk_max_chars to stay under Google Translate public API limits
     chunks = join_sentences(sub_content, chunk_max_chars) or []
 
@@ -80,7 +98,7 @@ def translate_srt_file(srt_file_path: Path, translated_subtitle_path: Path, targ
     os.makedirs(translated_subtitle_path.parent, exist_ok=True)
     subs.save(translated_subtitle_path, encoding='utf-8')
 
-    print('\r                         ', end='\r')
+    print('\r\x1b[2K', end='')
 
     return subs
 
@@ -91,9 +109,7 @@ async def translate_chunk(index, chunk, target_lang):
     while True:
         try:
             # Translate the subtitle content of the chunk using Google Translate
-            translator = deep_translator.google.GoogleTranslator(
-                source='auto', target=target_lang)
-            translated_chunk: str = await asyncio.wait_for(asyncio.get_event_loop().run_in_executor(None, translator.translate, chunk), 30)
+            translated_chunk: str = await asyncio.wait_for(asyncio.get_event_loop().run_in_executor(None, translate_text, chunk, target_lang), 30)
             await asyncio.sleep(0)
 
             # if nothing is retuned, return the original chunk
@@ -103,12 +119,21 @@ async def translate_chunk(index, chunk, target_lang):
             return translated_chunk
         except Exception as e:
             # If an error occurred, retry
-            del translator
             print(
                 f"\r[chunk {index}]: Exception: {e.__doc__} Retrying in 30 seconds...", flush=True)
             await asyncio.sleep(30)
 
 
+def translate_text(text, target_lang):
+    # reuse the translator created by this thread. GoogleTranslator keeps request params in the instance, so it can't be shared between threads
+    if not hasattr(translators, "by_lang"):
+        translators.by_lang = {}
+    if target_lang not in translators.by_lang:
+        translators.by_lang[target_lang] = deep_translator.google.GoogleTranslator(
+            source='auto', target=target_lang)
+    return translators.by_lang[target_lang].translate(text)
+
+
 def join_sentences(lines, max_chars):
     """
     Joins the given list of strings in a way that each part ends with a sentence ending.
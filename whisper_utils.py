@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 
+import numpy as np
 import pysrt
 import whisper
 import whisper.transcribe
@@ -9,10 +10,7 @@ import subtitle_utils
 from utils import time_task
 
 
-def transcribe_audio(model: whisper.model, audio_path: Path, srt_path: Path, lang: str = None, disable_fp16: bool = False):
-    # Load audio
-    audio = whisper.load_audio(file=audio_path.as_posix())
-    
+def transcribe_audio(model: whisper.model, audio: np.ndarray, srt_path: Path, lang: str = None, disable_fp16: bool = False):
     # Transcribe
     with time_task():
         transcribe = model.transcribe(audio=audio, language=lang, fp16=False if disable_fp16 else True, verbose=False)
@@ -38,9 +36,8 @@ def transcribe_audio(model: whisper.model, audio_path: Path, srt_path: Path, lan
     return transcribe
 
 
-def detect_language(model: str, audio_path: Path):
-    # load audio and pad/trim it to fit 30 seconds
-    audio = whisper.load_audio(audio_path.as_posix())
+def detect_language(model: str, audio: np.ndarray):
+    # pad/trim audio to fit 30 seconds
     audio = whisper.pad_or_trim(audio)
     # make log-Mel spectrogram and move to the same device as the model
     mel = whisper.log_mel_spectrogram(audio).to(model.device)
@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 
+import numpy as np
 import whisperx
 import whisper # only for detect language
 
@@ -8,9 +9,7 @@ import whisper_utils
 import subtitle_utils
 from utils import time_task
 
-def transcribe_audio(model: whisperx.asr.WhisperModel, audio_path: Path, srt_path: Path, lang: str = None, device: str = "cpu", batch_size: int = 4):
-    audio = whisperx.load_audio(file=audio_path.as_posix(), sr=model.model.feature_extractor.sampling_rate)
-        
+def transcribe_audio(model: whisperx.asr.WhisperModel, audio: np.ndarray, srt_path: Path, lang: str = None, device: str = "cpu", batch_size: int = 4):
     # Define the progress callback function
     def progress_callback(state, current: int = None, total: int = None):
         args = state, current, total
@@ -35,7 +34,7 @@ def transcribe_audio(model: whisperx.asr.WhisperModel, audio_path: Path, srt_pat
         except:
             state = "WhisperX"
 
-        print('\r                                                            \r' + state + ((': ' + str(round(current/total*100)) + '%') if current and total else '') + ((' [' + str(current) + '/' + str(total) + ']') if current and total else ''), end=' ', flush=True)
+        print('\r\x1b[2K' + state + ((': ' + str(round(current/total*100)) + '%') if current and total else '') + ((' [' + str(current) + '/' + str(total) + ']') if current and total else ''), end=' ', flush=True)
 
     # Transcribe
     with time_task("Running WhisperX transcription engine...", end='\n'):
@@ -62,11 +61,10 @@ def transcribe_audio(model: whisperx.asr.WhisperModel, audio_path: Path, srt_pat
     return transcribe
 
 
-def detect_language(model: whisperx.asr.WhisperModel, audio_path: Path):
+def detect_language(model: whisperx.asr.WhisperModel, audio: np.ndarray):
     try:
         if os.getenv("COLAB_RELEASE_TAG"):
             raise Exception("Method invalid for Google Colab") 
-        audio = whisperx.load_audio(audio_path.as_posix(), model.model.feature_extractor.sampling_rate)
         audio = whisper.pad_or_trim(audio, model.model.feature_extractor.n_samples)
         mel = whisperx.asr.log_mel_spectrogram(audio, n_mels=model.model.model.n_mels)
         encoder_output = model.model.encode(mel)
@@ -76,4 +74,4 @@ def detect_language(model: whisperx.asr.WhisperModel, audio_path: Path):
     except:
         print("using whisper base model for detection: ", end='')
         whisper_model = whisper.load_model("base", device="cpu", in_memory=True)
-        return whisper_utils.detect_language(model=whisper_model, audio_path=audio_path)
+        return whisper_utils.detect_language(model=whisper_model, audio=audio)